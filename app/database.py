@@ -2,7 +2,8 @@
 Database configuration and session management
 Supports both SQLite (for local development) and PostgreSQL (for production)
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -24,6 +25,7 @@ if is_sqlite:
     engine = create_engine(
         DATABASE_URL,
         connect_args={"check_same_thread": False},
+        query_cache_size=1200,  # Larger compiled-statement cache for ORM-heavy endpoints
         echo=False
     )
 else:
@@ -31,14 +33,66 @@ else:
     # Use connection pooling for better performance
     engine = create_engine(
         DATABASE_URL,
-        pool_size=10,
-        max_overflow=20,
+        pool_size=30,
+        max_overflow=60,
+        pool_recycle=3600,  # Recycle connections hourly to avoid stale sockets
+        pool_timeout=10,
         pool_pre_ping=True,  # Verify connections before using them
+        query_cache_size=1200,  # Larger compiled-statement cache for ORM-heavy endpoints
         echo=False
     )
 
+# Async engine for the async routers - same database through the async driver
+# (aiosqlite locally, asyncpg in production) so queries run on the event loop
+# instead of tying up threadpool workers
+if is_sqlite:
+    ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        query_cache_size=1200,
+        echo=False
+    )
+else:
+    ASYNC_DATABASE_URL = (
+        DATABASE_URL
+        .replace("postgresql+psycopg2://", "postgresql://", 1)
+        .replace("postgresql://", "postgresql+asyncpg://", 1)
+    )
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_size=30,
+        max_overflow=60,
+        pool_recycle=3600,
+        pool_timeout=10,
+        pool_pre_ping=True,
+        query_cache_size=1200,
+        echo=False
+    )
+
+if is_sqlite:
+    # Tune every SQLite connection for the chat workload: WAL amortizes the
+    # per-commit fsync across writers, synchronous=NORMAL keeps durability to
+    # the checkpoint window, temp structures stay in memory and reads go
+    # through a 256MB mmap window instead of read() calls
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
+
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    # The async engine wraps a sync aiosqlite core; the hook fires on its
+    # underlying DBAPI connections the same way
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
 # Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False keeps loaded attributes usable after commit instead
+# of re-selecting every object on next access
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # Base class for models
 Base = declarative_base()
@@ -55,6 +109,14 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """
+    Dependency function to get an async database session
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     """
     Initialize database tables - creates tables if they don't exist
@@ -62,7 +124,85 @@ def init_db():
     """
     # Create all tables if they don't exist (doesn't drop existing data)
     Base.metadata.create_all(bind=engine)
-    
+
+    # On PostgreSQL, back the leading-wildcard username search with a
+    # trigram GIN index so ILIKE '%q%' is index-assisted instead of a scan
+    if not is_sqlite:
+        try:
+            with engine.begin() as conn:
+                conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                conn.exec_driver_sql(
+                    "CREATE INDEX IF NOT EXISTS idx_users_username_trgm "
+                    "ON users USING gin (username gin_trgm_ops)"
+                )
+        except Exception as e:
+            print(f"Could not create trigram index (needs pg_trgm): {e}")
+
+        # Existing Postgres databases still carry the baseline's native enum
+        # status column; migrate_db.py only speaks sqlite3 and never touches
+        # them. Convert in place to the SMALLINT codes the int-typed
+        # statements and MessageStatusType expect, and add the composite
+        # indexes create_all does not retrofit onto existing tables
+        try:
+            with engine.begin() as conn:
+                status_type = conn.exec_driver_sql(
+                    "SELECT data_type FROM information_schema.columns "
+                    "WHERE table_name = 'messages' AND column_name = 'status'"
+                ).scalar()
+                if status_type and status_type not in ("smallint", "integer"):
+                    conn.exec_driver_sql(
+                        "ALTER TABLE messages ALTER COLUMN status DROP DEFAULT"
+                    )
+                    conn.exec_driver_sql(
+                        "ALTER TABLE messages ALTER COLUMN status TYPE smallint "
+                        "USING (CASE status::text "
+                        "WHEN 'SENT' THEN 0 WHEN 'sent' THEN 0 "
+                        "WHEN 'DELIVERED' THEN 1 WHEN 'delivered' THEN 1 "
+                        "WHEN 'READ' THEN 2 WHEN 'read' THEN 2 "
+                        "ELSE 0 END)"
+                    )
+                    conn.exec_driver_sql(
+                        "ALTER TABLE messages ALTER COLUMN status SET DEFAULT 0"
+                    )
+                    # The enum type is orphaned once the column is integer
+                    conn.exec_driver_sql("DROP TYPE IF EXISTS messagestatus")
+                conn.exec_driver_sql(
+                    "CREATE INDEX IF NOT EXISTS ix_messages_conv_sender_status "
+                    "ON messages (conversation_id, sender_id, status)"
+                )
+                conn.exec_driver_sql(
+                    "CREATE INDEX IF NOT EXISTS ix_messages_room_created "
+                    "ON messages (room_id, created_at)"
+                )
+                conn.exec_driver_sql(
+                    "CREATE INDEX IF NOT EXISTS ix_messages_room_sender_status "
+                    "ON messages (room_id, sender_id, status)"
+                )
+        except Exception as e:
+            print(f"Could not migrate message status storage: {e}")
+
+        # messages.file_id is likewise only added by the sqlite3 migration;
+        # without it every mapped SELECT of Message fails on an existing
+        # Postgres database. Add the column, backfill the download id from
+        # the stored path (basename minus extension) and index it
+        try:
+            with engine.begin() as conn:
+                conn.exec_driver_sql(
+                    "ALTER TABLE messages "
+                    "ADD COLUMN IF NOT EXISTS file_id VARCHAR(64)"
+                )
+                conn.exec_driver_sql(
+                    "UPDATE messages SET file_id = "
+                    r"regexp_replace(regexp_replace(file_path, '.*/', ''), '\.[^.]*$', '') "
+                    "WHERE file_path IS NOT NULL AND file_id IS NULL"
+                )
+                conn.exec_driver_sql(
+                    "CREATE INDEX IF NOT EXISTS ix_messages_file_id "
+                    "ON messages (file_id)"
+                )
+        except Exception as e:
+            print(f"Could not backfill message file ids: {e}")
+
     # Run migrations to add new columns if needed
     try:
         from migrate_db import migrate_database
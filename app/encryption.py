@@ -3,50 +3,137 @@ Message encryption utilities using AES encryption
 """
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.backends import default_backend
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
 import base64
+import hashlib
 import os
 
 # Generate a key from a password (in production, use a secure key management system)
 SECRET_KEY = os.getenv("ENCRYPTION_KEY", "your-encryption-key-change-in-production").encode()
 SALT = os.getenv("ENCRYPTION_SALT", "your-salt-change-in-production").encode()
 
-def get_encryption_key() -> bytes:
-    """Generate encryption key from secret"""
+# AES-GCM nonce size in bytes (96-bit, the recommended size)
+NONCE_SIZE = 12
+
+# PBKDF2 work factor; also part of the key-cache fingerprint below
+KDF_ITERATIONS = 100000
+
+# Derived-key cache so process boots skip the 100k-iteration KDF.
+# Set ENCRYPTION_KEY_CACHE_DIR="" to disable.
+_KEY_CACHE_DIR = os.getenv(
+    "ENCRYPTION_KEY_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "chattapp")
+)
+
+
+def _key_cache_path() -> Path:
+    """Cache file path keyed by a fingerprint of the KDF inputs"""
+    fingerprint = hashlib.sha256(
+        SECRET_KEY + b"\x00" + SALT + b"\x00" + str(KDF_ITERATIONS).encode()
+    ).hexdigest()
+    return Path(_KEY_CACHE_DIR) / f"{fingerprint}.key"
+
+@lru_cache(maxsize=1)
+def get_raw_key() -> bytes:
+    """Derive the raw 32-byte AES key from secret (cached - PBKDF2 runs 100k iterations)"""
+    cache_path = _key_cache_path() if _KEY_CACHE_DIR else None
+    if cache_path:
+        try:
+            key = cache_path.read_bytes()
+            if len(key) == 32:
+                return key
+        except OSError:
+            pass
+
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,
         salt=SALT,
-        iterations=100000,
+        iterations=KDF_ITERATIONS,
         backend=default_backend()
     )
-    key = base64.urlsafe_b64encode(kdf.derive(SECRET_KEY))
+    key = kdf.derive(SECRET_KEY)
+
+    if cache_path:
+        # Atomic write, owner-read/write only
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(key)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
     return key
 
-# Initialize Fernet cipher
-_fernet = Fernet(get_encryption_key())
+@lru_cache(maxsize=1)
+def get_encryption_key() -> bytes:
+    """Generate the urlsafe-base64 key for the legacy Fernet cipher (cached)"""
+    return base64.urlsafe_b64encode(get_raw_key())
+
+# AES-GCM cipher: one shared instance (stateless apart from the key, safe
+# across threads) on the hardware AES-NI path, single base64 pass per message
+_aesgcm = AESGCM(get_raw_key())
+
+
+@lru_cache(maxsize=1)
+def _get_fernet() -> Fernet:
+    """Legacy Fernet cipher, built only if a pre-AES-GCM row needs decrypting"""
+    return Fernet(get_encryption_key())
 
 def encrypt_message(message: str) -> str:
     """Encrypt a message"""
     if not message:
         return message
     try:
-        encrypted = _fernet.encrypt(message.encode())
-        return base64.urlsafe_b64encode(encrypted).decode()
+        nonce = os.urandom(NONCE_SIZE)
+        encrypted = _aesgcm.encrypt(nonce, message.encode(), None)
+        return base64.b64encode(nonce + encrypted).decode()
     except Exception as e:
         print(f"Encryption error: {e}")
         return message
 
+# Shared pool for batch decryption; the AEAD calls run in C and release
+# the GIL, so batches overlap across workers
+_batch_pool = ThreadPoolExecutor(max_workers=4)
+
+def decrypt_messages(encrypted_messages: list) -> list:
+    """Decrypt a batch of messages concurrently, preserving order"""
+    if not encrypted_messages:
+        return []
+    if len(encrypted_messages) == 1:
+        return [decrypt_message(encrypted_messages[0])]
+    return list(_batch_pool.map(decrypt_message, encrypted_messages))
+
+@lru_cache(maxsize=4096)
 def decrypt_message(encrypted_message: str) -> str:
-    """Decrypt a message"""
+    """Decrypt a message
+
+    Ciphertext -> plaintext is a pure function of the ciphertext, so results
+    are memoized: a reply parent referenced by several messages, or a row
+    scanned by repeated searches, is only decrypted once per process.
+    """
     if not encrypted_message:
         return encrypted_message
     try:
-        decoded = base64.urlsafe_b64decode(encrypted_message.encode())
-        decrypted = _fernet.decrypt(decoded)
+        decoded = base64.b64decode(encrypted_message.encode())
+        decrypted = _aesgcm.decrypt(decoded[:NONCE_SIZE], decoded[NONCE_SIZE:], None)
         return decrypted.decode()
-    except Exception as e:
-        print(f"Decryption error: {e}")
-        return encrypted_message
-
+    except Exception:
+        # Fall back to legacy Fernet rows: try a bare Fernet token first
+        # (already base64), then the historical base64-of-base64 wrapping
+        try:
+            return _get_fernet().decrypt(encrypted_message.encode()).decode()
+        except Exception:
+            try:
+                decoded = base64.urlsafe_b64decode(encrypted_message.encode())
+                return _get_fernet().decrypt(decoded).decode()
+            except Exception as e:
+                print(f"Decryption error: {e}")
+                return encrypted_message
@@ -1,9 +1,10 @@
 """
 SQLAlchemy database models
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Enum as SQLEnum
+from sqlalchemy import Column, Integer, SmallInteger, String, DateTime, ForeignKey, Index, Text, Boolean, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from sqlalchemy.types import TypeDecorator
 import enum
 from app.database import Base
 
@@ -15,6 +16,45 @@ class MessageStatus(str, enum.Enum):
     READ = "read"
 
 
+class MessageStatusType(TypeDecorator):
+    """Stores MessageStatus as a SMALLINT
+
+    Integer codes keep status rows/index tuples small and make the status
+    filters integer compares instead of VARCHAR compares. Legacy rows that
+    still hold the old VARCHAR enum strings are converted on read.
+    """
+    impl = SmallInteger
+    cache_ok = True
+
+    _to_int = {
+        MessageStatus.SENT: 0,
+        MessageStatus.DELIVERED: 1,
+        MessageStatus.READ: 2,
+    }
+    _from_int = {code: status for status, code in _to_int.items()}
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str) and not isinstance(value, MessageStatus):
+            value = MessageStatus(value)
+        return self._to_int[value]
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            # Legacy VARCHAR rows: enum name ("SENT"), value ("sent"), or an
+            # int code stored as text by a TEXT-affinity column ("0")
+            if value.isdigit():
+                return self._from_int[int(value)]
+            try:
+                return MessageStatus[value]
+            except KeyError:
+                return MessageStatus(value.lower())
+        return self._from_int[int(value)]
+
+
 class User(Base):
     """User model for authentication and user management"""
     __tablename__ = "users"
@@ -36,7 +76,11 @@ class User(Base):
 
 
 class Conversation(Base):
-    """1-on-1 conversation model (WhatsApp-like)"""
+    """1-on-1 conversation model (WhatsApp-like)
+
+    New rows store the pair normalized as (min(user_id), max(user_id)) so the
+    unique constraint makes conversation creation race-free.
+    """
     __tablename__ = "conversations"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -50,6 +94,11 @@ class Conversation(Base):
     user2 = relationship("User", foreign_keys=[user2_id], back_populates="conversations_user2")
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan", order_by="Message.created_at")
 
+    # Unique constraint: one conversation per (normalized) user pair
+    __table_args__ = (
+        UniqueConstraint("user1_id", "user2_id", name="uq_conversation_pair"),
+    )
+
 
 class Room(Base):
     """Group room model for multiple users"""
@@ -87,6 +136,25 @@ class RoomMember(Base):
     )
 
 
+class MessageSearchEntry(Base):
+    """Write-time search index row mirroring a message's plaintext
+
+    Encrypted message content cannot be matched in SQL, so searchable text
+    (lowercased) is stored here when a message is written and the search
+    endpoints query this table instead of decrypting messages per request.
+    """
+    __tablename__ = "message_search_index"
+
+    id = Column(Integer, primary_key=True, index=True)
+    message_id = Column(Integer, ForeignKey("messages.id"), nullable=False, unique=True, index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=True, index=True)
+    room_id = Column(Integer, ForeignKey("rooms.id"), nullable=True, index=True)
+    content = Column(Text, nullable=False)
+
+    # Relationships
+    message = relationship("Message")
+
+
 class MessageType(str, enum.Enum):
     """Message type enum"""
     TEXT = "text"
@@ -104,8 +172,9 @@ class Message(Base):
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=True, index=True)
     room_id = Column(Integer, ForeignKey("rooms.id"), nullable=True, index=True)
-    status = Column(SQLEnum(MessageStatus), default=MessageStatus.SENT, nullable=False)
+    status = Column(MessageStatusType, default=MessageStatus.SENT, nullable=False)
     file_path = Column(String(500), nullable=True)  # For file attachments
+    file_id = Column(String(64), index=True, nullable=True)  # Download lookup key (content digest, shared by duplicate uploads)
     file_name = Column(String(255), nullable=True)  # Original filename
     file_size = Column(Integer, nullable=True)  # File size in bytes
     is_encrypted = Column(Boolean, default=False, nullable=False)
@@ -121,3 +190,11 @@ class Message(Base):
     room = relationship("Room", back_populates="messages")
     reply_to = relationship("Message", remote_side=[id], foreign_keys=[reply_to_id])
 
+    # Composite indexes covering the unread-count aggregates, status updates
+    # and the room page sort / last-message lookup
+    __table_args__ = (
+        Index("ix_messages_conv_sender_status", "conversation_id", "sender_id", "status"),
+        Index("ix_messages_room_created", "room_id", "created_at"),
+        Index("ix_messages_room_sender_status", "room_id", "sender_id", "status"),
+    )
+
@@ -1,112 +1,142 @@
 """
 Conversation routes: direct messaging (WhatsApp-like)
+
+This router runs on the async engine (see app/database.py): queries await on
+the event loop instead of occupying threadpool workers, so slow statements
+stall only their own request.
 """
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, Body
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, or_, and_
+import os
+import time
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Body
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy import desc, or_, and_, select, update, text, bindparam
+from sqlalchemy import Integer, String, DateTime, Text, Boolean
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import func
-from app.database import get_db
-from app.models import User, Conversation, Message, MessageStatus
+from app.database import get_async_db
+from app.models import User, Conversation, Message, MessageStatus, MessageSearchEntry
 from app.schemas import ConversationResponse, MessageCreate, MessageResponse
 from app.auth import get_current_active_user
+from app.encryption import encrypt_message, decrypt_message, decrypt_messages
+from app.search import index_message_async, unindex_message_async
 from app.websocket import online_users
 from datetime import datetime, timezone, timedelta
 
 router = APIRouter(prefix="/api/conversations", tags=["conversations"])
 
+# The conversation list runs the same SQL for every user - only the user id
+# changes - so the statement is built and compiled once per process and the
+# rows are consumed as plain Core mappings: no ORM identity map or per-row
+# instance construction for data that is immediately reshaped into
+# ConversationResponse. Scalar subselects instead of LATERAL joins keep the
+# statement portable between SQLite and PostgreSQL; status 2 is READ (see
+# MessageStatusType).
+_CONV_LIST_STMT = (
+    text("""
+        SELECT c.id AS id, c.user1_id AS user1_id, c.user2_id AS user2_id,
+               c.created_at AS created_at,
+               u.id AS other_id, u.username AS other_username,
+               u.last_seen AS other_last_seen,
+               lm.content AS last_content, lm.created_at AS last_created_at,
+               lm.is_encrypted AS last_is_encrypted,
+               lm.is_deleted AS last_is_deleted,
+               (SELECT COUNT(*) FROM messages m2
+                WHERE m2.conversation_id = c.id
+                  AND m2.sender_id <> :uid
+                  AND m2.status <> 2
+                  AND m2.is_deleted = false) AS unread_count
+        FROM conversations c
+        JOIN users u
+          ON u.id = CASE WHEN c.user1_id = :uid THEN c.user2_id ELSE c.user1_id END
+        LEFT JOIN messages lm
+          ON lm.id = (SELECT MAX(m.id) FROM messages m WHERE m.conversation_id = c.id)
+        WHERE c.user1_id = :uid OR c.user2_id = :uid
+        ORDER BY c.last_message_at DESC
+    """)
+    .bindparams(bindparam("uid"))
+    .columns(
+        id=Integer,
+        user1_id=Integer,
+        user2_id=Integer,
+        created_at=DateTime,
+        other_id=Integer,
+        other_username=String,
+        other_last_seen=DateTime,
+        last_content=Text,
+        last_created_at=DateTime,
+        last_is_encrypted=Boolean,
+        last_is_deleted=Boolean,
+        unread_count=Integer,
+    )
+)
+
 
 @router.get("/", response_model=List[ConversationResponse])
-def get_conversations(
-    db: Session = Depends(get_db),
+async def get_conversations(
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get all conversations for the current user"""
-    # Get conversations where user is either user1 or user2
-    conversations = (
-        db.query(Conversation)
-        .filter(
-            or_(
-                Conversation.user1_id == current_user.id,
-                Conversation.user2_id == current_user.id
-            )
-        )
-        .order_by(desc(Conversation.last_message_at))
-        .all()
-    )
-    
-    result = []
-    for conv in conversations:
-        # Determine the other user
-        if conv.user1_id == current_user.id:
-            other_user = conv.user2
-            other_user_id = conv.user2_id
-        else:
-            other_user = conv.user1
-            other_user_id = conv.user1_id
-        
-        # Get last message
-        last_message = (
-            db.query(Message)
-            .filter(Message.conversation_id == conv.id)
-            .order_by(desc(Message.created_at))
-            .first()
-        )
-        
-        # Decrypt last message if encrypted (for preview display)
+    # One prepared statement (see _CONV_LIST_STMT above): conversations, the
+    # other user, last message and unread count in a single round trip,
+    # consumed as Core rows
+    rows = (
+        await db.execute(_CONV_LIST_STMT, {"uid": current_user.id})
+    ).mappings().all()
+
+
+    now_mono = time.monotonic()
+    entries = []
+    encrypted_previews = []  # (entry index, ciphertext) pairs for batch decryption
+    for row in rows:
+        other_user_id = row["other_id"]
+
+        # Preview content; encrypted previews are collected and decrypted in one batch
         last_message_content = None
-        if last_message and not last_message.is_deleted:
-            last_message_content = last_message.content
-            if last_message.is_encrypted:
-                try:
-                    from app.encryption import decrypt_message
-                    last_message_content = decrypt_message(last_message.content)
-                except:
-                    # If decryption fails, show placeholder
-                    last_message_content = "🔒 Encrypted message"
-        
-        # Count unread messages (messages not sent by current user and not read)
-        unread_count = (
-            db.query(func.count(Message.id))
-            .filter(
-                and_(
-                    Message.conversation_id == conv.id,
-                    Message.sender_id != current_user.id,
-                    Message.status != MessageStatus.READ,
-                    Message.is_deleted == False
-                )
-            )
-            .scalar() or 0
-        )
-        
+        if row["last_content"] is not None and not row["last_is_deleted"]:
+            last_message_content = row["last_content"]
+            if row["last_is_encrypted"]:
+                encrypted_previews.append((len(entries), row["last_content"]))
+
         # Check if other user is online (active in last 30 seconds)
-        is_online = False
-        if other_user_id in online_users:
-            last_active = online_users[other_user_id]
-            if isinstance(last_active, datetime):
-                time_diff = datetime.now(timezone.utc) - last_active
-                is_online = time_diff < timedelta(seconds=30)
-        
-        result.append(ConversationResponse(
-            id=conv.id,
-            user1_id=conv.user1_id,
-            user2_id=conv.user2_id,
+        last_active = online_users.get(other_user_id)
+        is_online = last_active is not None and (now_mono - last_active) < 30
+
+
+        entries.append(ConversationResponse(
+            id=row["id"],
+            user1_id=row["user1_id"],
+            user2_id=row["user2_id"],
             other_user_id=other_user_id,
-            other_username=other_user.username,
+            other_username=row["other_username"],
             last_message=last_message_content,
-            last_message_at=last_message.created_at if last_message else conv.created_at,
-            unread_count=unread_count,
+            last_message_at=row["last_created_at"] or row["created_at"],
+            unread_count=row["unread_count"] or 0,
             other_user_online=is_online,
-            other_user_last_seen=other_user.last_seen
+            other_user_last_seen=row["other_last_seen"]
         ))
-    
-    return result
+
+    # Batch-decrypt encrypted previews in the threadpool so the event loop
+    # stays free while the GIL-releasing crypto calls overlap
+    if encrypted_previews:
+        decrypted = await run_in_threadpool(
+            decrypt_messages, [c for _, c in encrypted_previews]
+        )
+        for (idx, _), plaintext in zip(encrypted_previews, decrypted):
+            entries[idx].last_message = plaintext
+
+    return entries
 
 
 @router.post("/with/{user_id}", response_model=ConversationResponse)
-def get_or_create_conversation(
+async def get_or_create_conversation(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get or create a conversation with another user"""
@@ -115,57 +145,77 @@ def get_or_create_conversation(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Cannot create conversation with yourself"
         )
-    
+
     # Check if other user exists
-    other_user = db.query(User).filter(User.id == user_id).first()
+    other_user = await db.get(User, user_id)
     if not other_user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-    
-    # Check if conversation already exists
+
+    # Check if conversation already exists (legacy rows may store the pair in
+    # either order, so match both)
     conversation = (
-        db.query(Conversation)
-        .filter(
-            or_(
-                and_(Conversation.user1_id == current_user.id, Conversation.user2_id == user_id),
-                and_(Conversation.user1_id == user_id, Conversation.user2_id == current_user.id)
+        await db.execute(
+            select(Conversation)
+            .where(
+                or_(
+                    and_(Conversation.user1_id == current_user.id, Conversation.user2_id == user_id),
+                    and_(Conversation.user1_id == user_id, Conversation.user2_id == current_user.id)
+                )
             )
         )
-        .first()
-    )
-    
+    ).scalars().first()
+
     if not conversation:
-        # Create new conversation
+        # Create new conversation; the pair is stored normalized so the unique
+        # constraint turns a concurrent duplicate insert into an IntegrityError
+        # instead of a duplicate row. created_at is set here rather than by the
+        # server default: the async session cannot lazy-load it afterwards
+        lo, hi = sorted((current_user.id, user_id))
         conversation = Conversation(
-            user1_id=current_user.id,
-            user2_id=user_id
+            user1_id=lo,
+            user2_id=hi,
+            created_at=datetime.now(timezone.utc)
         )
         db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
-    
+        try:
+            # No refresh needed: the id comes back with the INSERT
+            await db.commit()
+        except IntegrityError:
+            # Another request created it between our SELECT and INSERT
+            await db.rollback()
+            conversation = (
+                await db.execute(
+                    select(Conversation)
+                    .where(
+                        and_(Conversation.user1_id == lo, Conversation.user2_id == hi)
+                    )
+                )
+            ).scalars().first()
+
     # Get last message
     last_message = (
-        db.query(Message)
-        .filter(Message.conversation_id == conversation.id)
-        .order_by(desc(Message.created_at))
-        .first()
-    )
-    
+        await db.execute(
+            select(Message)
+            .where(Message.conversation_id == conversation.id)
+            .order_by(desc(Message.created_at))
+            .limit(1)
+        )
+    ).scalars().first()
+
     # Decrypt last message if encrypted (for preview display)
     last_message_content = None
     if last_message and not last_message.is_deleted:
         last_message_content = last_message.content
         if last_message.is_encrypted:
             try:
-                from app.encryption import decrypt_message
                 last_message_content = decrypt_message(last_message.content)
             except:
                 # If decryption fails, show placeholder
                 last_message_content = "🔒 Encrypted message"
-    
+
     return ConversationResponse(
         id=conversation.id,
         user1_id=conversation.user1_id,
@@ -180,105 +230,235 @@ def get_or_create_conversation(
     )
 
 
+@router.get("/search/messages", response_model=List[dict])
+async def search_messages(
+    q: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Search for messages containing the query text in conversations
+
+    Runs against the write-time search index (see app/search.py), so no
+    message is loaded or decrypted here. Registered before the
+    /{conversation_id}/messages route so the literal path wins the match.
+    """
+    if len(q) < 1:
+        return []
+
+    # Get all conversations the user is part of
+    user_conversation_ids = (
+        await db.execute(
+            select(Conversation.id)
+            .where(
+                or_(
+                    Conversation.user1_id == current_user.id,
+                    Conversation.user2_id == current_user.id
+                )
+            )
+        )
+    ).scalars().all()
+
+    if not user_conversation_ids:
+        return []
+
+    # Server-side match + per-conversation count in one indexed query
+    matches = (
+        await db.execute(
+            select(
+                MessageSearchEntry.conversation_id,
+                func.count(MessageSearchEntry.id).label("match_count")
+            )
+            .where(
+                and_(
+                    MessageSearchEntry.conversation_id.in_(user_conversation_ids),
+                    MessageSearchEntry.content.contains(q.lower())
+                )
+            )
+            .group_by(MessageSearchEntry.conversation_id)
+        )
+    ).all()
+
+    match_counts = dict(matches)
+
+    # Messages written before the search index existed have no index row.
+    # Unencrypted ones are matched server-side; only the encrypted remainder
+    # falls back to a bounded decrypt-and-scan.
+    indexed_ids = select(MessageSearchEntry.message_id)
+    legacy_plain = (
+        await db.execute(
+            select(
+                Message.conversation_id,
+                func.count(Message.id)
+            )
+            .where(
+                and_(
+                    Message.conversation_id.in_(user_conversation_ids),
+                    Message.is_deleted == False,
+                    Message.is_encrypted == False,
+                    ~Message.id.in_(indexed_ids),
+                    Message.content.ilike(f"%{q}%")
+                )
+            )
+            .group_by(Message.conversation_id)
+        )
+    ).all()
+    for conv_id, count in legacy_plain:
+        match_counts[conv_id] = match_counts.get(conv_id, 0) + count
+
+    legacy_encrypted = (
+        await db.execute(
+            select(Message.conversation_id, Message.content)
+            .where(
+                and_(
+                    Message.conversation_id.in_(user_conversation_ids),
+                    Message.is_deleted == False,
+                    Message.is_encrypted == True,
+                    ~Message.id.in_(indexed_ids)
+                )
+            )
+            .order_by(desc(Message.created_at))
+            .limit(500)
+        )
+    ).all()
+    if legacy_encrypted:
+        plaintexts = await run_in_threadpool(
+            decrypt_messages, [content for _, content in legacy_encrypted]
+        )
+        for (conv_id, _), plaintext in zip(legacy_encrypted, plaintexts):
+            if q.lower() in plaintext.lower():
+                match_counts[conv_id] = match_counts.get(conv_id, 0) + 1
+
+    if not match_counts:
+        return []
+    conversations = (
+        await db.execute(
+            select(Conversation)
+            .options(joinedload(Conversation.user1), joinedload(Conversation.user2))
+            .where(Conversation.id.in_(match_counts))
+        )
+    ).scalars().all()
+
+    result = []
+    for conv in conversations:
+        # Determine the other user
+        if conv.user1_id == current_user.id:
+            other_user = conv.user2
+            other_user_id = conv.user2_id
+        else:
+            other_user = conv.user1
+            other_user_id = conv.user1_id
+
+        result.append({
+            "type": "conversation",
+            "id": conv.id,
+            "other_user_id": other_user_id,
+            "other_username": other_user.username,
+            "match_count": match_counts[conv.id]
+        })
+
+    return result
+
+
 @router.get("/{conversation_id}/messages", response_model=List[MessageResponse])
-def get_messages(
+async def get_messages(
     conversation_id: int,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get messages for a conversation"""
     # Verify conversation exists and user is part of it
     conversation = (
-        db.query(Conversation)
-        .filter(
-            and_(
-                Conversation.id == conversation_id,
-                or_(
-                    Conversation.user1_id == current_user.id,
-                    Conversation.user2_id == current_user.id
+        await db.execute(
+            select(Conversation)
+            .where(
+                and_(
+                    Conversation.id == conversation_id,
+                    or_(
+                        Conversation.user1_id == current_user.id,
+                        Conversation.user2_id == current_user.id
+                    )
                 )
             )
         )
-        .first()
-    )
-    
+    ).scalars().first()
+
     if not conversation:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Conversation not found"
         )
-    
-    # Mark messages as delivered if they're from the other user
+
+    # Mark the other user's messages as read; the viewer has the thread open,
+    # so SENT and DELIVERED collapse to READ in a single UPDATE
     other_user_id = conversation.user2_id if conversation.user1_id == current_user.id else conversation.user1_id
-    db.query(Message).filter(
-        and_(
-            Message.conversation_id == conversation_id,
-            Message.sender_id == other_user_id,
-            Message.status == MessageStatus.SENT
-        )
-    ).update({Message.status: MessageStatus.DELIVERED})
-    
-    # Mark messages as read
-    db.query(Message).filter(
-        and_(
-            Message.conversation_id == conversation_id,
-            Message.sender_id == other_user_id,
-            Message.status == MessageStatus.DELIVERED
+    await db.execute(
+        update(Message)
+        .where(
+            and_(
+                Message.conversation_id == conversation_id,
+                Message.sender_id == other_user_id,
+                Message.status.in_([MessageStatus.SENT, MessageStatus.DELIVERED])
+            )
         )
-    ).update({Message.status: MessageStatus.READ})
-    
-    db.commit()
-    
-    # Get messages (exclude deleted messages or show as deleted)
-    messages = (
-        db.query(Message)
-        .filter(Message.conversation_id == conversation_id)
-        .order_by(Message.created_at)
-        .offset(skip)
-        .limit(limit)
-        .all()
+        .values(status=MessageStatus.READ)
+        .execution_options(synchronize_session=False)
     )
-    
+
+    await db.commit()
+
+    # Get messages (exclude deleted messages or show as deleted); eager-load
+    # sender and reply-parent chains so the loop below issues no queries
+    messages = (
+        await db.execute(
+            select(Message)
+            .options(
+                joinedload(Message.sender),
+                joinedload(Message.reply_to).joinedload(Message.sender)
+            )
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at)
+            .offset(skip)
+            .limit(limit)
+        )
+    ).scalars().all()
+
     result = []
     for msg in messages:
         # Decrypt content if encrypted
         display_content = msg.content
         if msg.is_encrypted and not msg.is_deleted:
-            from app.encryption import decrypt_message
             try:
                 display_content = decrypt_message(msg.content)
             except:
                 display_content = msg.content
-        
+
         # Build file URL if file exists
         file_url = None
         if msg.file_path:
             # Extract file ID from path
-            import os
             file_name = os.path.basename(msg.file_path)
             file_id = os.path.splitext(file_name)[0]
             file_url = f"/api/files/{file_id}"
-        
-        # Get reply info if exists
+
+        # Get reply info if exists (loaded eagerly above)
         reply_to_content = None
         reply_to_sender = None
         if msg.reply_to_id:
-            reply_msg = db.query(Message).filter(Message.id == msg.reply_to_id).first()
+            reply_msg = msg.reply_to
             if reply_msg:
                 reply_to_sender = reply_msg.sender.username
                 if reply_msg.is_deleted:
                     reply_to_content = "This message was deleted"
                 elif reply_msg.is_encrypted:
                     try:
-                        from app.encryption import decrypt_message
                         reply_to_content = decrypt_message(reply_msg.content)
                     except:
                         reply_to_content = reply_msg.content
                 else:
                     reply_to_content = reply_msg.content[:50]  # Preview
-        
+
         result.append(MessageResponse(
             id=msg.id,
             content=display_content if not msg.is_deleted else "This message was deleted",
@@ -299,190 +479,124 @@ def get_messages(
             updated_at=msg.updated_at,
             created_at=msg.created_at
         ))
-    
+
     return result
 
 
-@router.get("/users/all", response_model=List[dict])
-def get_all_users(
-    db: Session = Depends(get_db),
+@router.get("/users/all")
+async def get_all_users(
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Get all users in the system (for adding to rooms)"""
-    users = db.query(User).filter(User.is_active == True).all()
-    
-    result = []
-    for user in users:
-        result.append({
-            "id": user.id,
-            "username": user.username,
-            "email": user.email
-        })
-    
-    return result
+    """Get users in the system (for adding to rooms), paginated
+
+    Streams the JSON array row by row instead of materializing every user
+    into one Python list before serializing.
+    """
+    stmt = (
+        select(User)
+        .where(User.is_active == True)
+        .order_by(User.id)
+        .offset(skip)
+        .limit(limit)
+        .execution_options(yield_per=200)
+    )
+
+    async def generate():
+        yield b"["
+        first = True
+        result = await db.stream_scalars(stmt)
+        async for user in result:
+            if not first:
+                yield b","
+            first = False
+            yield orjson.dumps({
+                "id": user.id,
+                "username": user.username,
+                "email": user.email
+            })
+        yield b"]"
+
+    return StreamingResponse(generate(), media_type="application/json")
 
 
 @router.get("/users/search", response_model=List[dict])
-def search_users(
+async def search_users(
     q: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Search for users to start a conversation"""
     if len(q) < 2:
         return []
-    
+
     users = (
-        db.query(User)
-        .filter(
-            and_(
-                User.id != current_user.id,
-                User.is_active == True,
-                User.username.ilike(f"%{q}%")
+        await db.execute(
+            select(User)
+            .where(
+                and_(
+                    User.id != current_user.id,
+                    User.is_active == True,
+                    User.username.ilike(f"%{q}%")
+                )
             )
+            .limit(20)
         )
-        .limit(20)
-        .all()
-    )
-    
-    return [{"id": user.id, "username": user.username, "email": user.email} for user in users]
-
+    ).scalars().all()
 
-@router.get("/search/messages", response_model=List[dict])
-def search_messages(
-    q: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
-):
-    """Search for messages containing the query text in conversations"""
-    if len(q) < 1:
-        return []
-    
-    # Get all conversations the user is part of
-    user_conversation_ids = [
-        conv.id for conv in db.query(Conversation.id)
-        .filter(
-            or_(
-                Conversation.user1_id == current_user.id,
-                Conversation.user2_id == current_user.id
-            )
-        )
-        .all()
-    ]
-    
-    if not user_conversation_ids:
-        return []
-    
-    # Search messages in those conversations
-    # IMPORTANT: Decrypt encrypted messages first, then search in plain text
-    matching_messages = []
-    all_messages = (
-        db.query(Message)
-        .filter(
-            and_(
-                Message.conversation_id.in_(user_conversation_ids),
-                Message.is_deleted == False
-            )
-        )
-        .order_by(desc(Message.created_at))
-        .limit(500)  # Get more messages to search through
-        .all()
-    )
-    
-    from app.encryption import decrypt_message
-    
-    for msg in all_messages:
-        # Always decrypt if encrypted, then search in plain text
-        search_content = msg.content
-        if msg.is_encrypted:
-            try:
-                # Decrypt the message to get plain text
-                search_content = decrypt_message(msg.content)
-            except Exception as e:
-                # If decryption fails, skip this message (can't search encrypted content)
-                continue
-        
-        # Search in plain text content (case-insensitive)
-        if q.lower() in search_content.lower():
-            matching_messages.append(msg)
-    
-    # Group by conversation_id and return unique conversation IDs
-    conversation_ids = set()
-    for msg in matching_messages:
-        conversation_ids.add(msg.conversation_id)
-    
-    # Get conversation details
-    result = []
-    for conv_id in conversation_ids:
-        conv = (
-            db.query(Conversation)
-            .filter(Conversation.id == conv_id)
-            .first()
-        )
-        if conv:
-            # Determine the other user
-            if conv.user1_id == current_user.id:
-                other_user = conv.user2
-                other_user_id = conv.user2_id
-            else:
-                other_user = conv.user1
-                other_user_id = conv.user1_id
-            
-            result.append({
-                "type": "conversation",
-                "id": conv.id,
-                "other_user_id": other_user_id,
-                "other_username": other_user.username,
-                "match_count": len([m for m in matching_messages if m.conversation_id == conv_id])
-            })
-    
-    return result
+    return [{"id": user.id, "username": user.username, "email": user.email} for user in users]
 
 
 @router.put("/messages/{message_id}", response_model=MessageResponse)
-def edit_message(
+async def edit_message(
     message_id: int,
     content: str = Body(..., embed=True),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Edit a message (only sender can edit, within 15 minutes)"""
-    message = db.query(Message).filter(Message.id == message_id).first()
+    message = (
+        await db.execute(
+            select(Message)
+            .options(joinedload(Message.sender))
+            .where(Message.id == message_id)
+        )
+    ).scalars().first()
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
-    
+
     if message.sender_id != current_user.id:
         raise HTTPException(status_code=403, detail="You can only edit your own messages")
-    
+
     if message.is_deleted:
         raise HTTPException(status_code=400, detail="Cannot edit deleted message")
-    
+
     # Check if message is within 15 minutes
     time_diff = datetime.now(timezone.utc) - message.created_at
     if time_diff > timedelta(minutes=15):
         raise HTTPException(status_code=400, detail="Message can only be edited within 15 minutes")
-    
+
     # Encrypt if needed
     if message.is_encrypted:
-        from app.encryption import encrypt_message
         message.content = encrypt_message(content)
     else:
         message.content = content
-    
+
     message.is_edited = True
     message.updated_at = datetime.now(timezone.utc)
-    db.commit()
-    db.refresh(message)
-    
+    await index_message_async(db, message, content)
+    await db.commit()
+
     # Return updated message
     display_content = content
     file_url = None
     if message.file_path:
-        import os
         file_name = os.path.basename(message.file_path)
         file_id = os.path.splitext(file_name)[0]
         file_url = f"/api/files/{file_id}"
-    
+
     return MessageResponse(
         id=message.id,
         content=display_content,
@@ -506,23 +620,28 @@ def edit_message(
 
 
 @router.delete("/messages/{message_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_message(
+async def delete_message(
     message_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Delete a message (soft delete - marks as deleted)"""
-    message = db.query(Message).filter(Message.id == message_id).first()
+    message = (
+        await db.execute(
+            select(Message)
+            .where(Message.id == message_id)
+        )
+    ).scalars().first()
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
-    
+
     if message.sender_id != current_user.id:
         raise HTTPException(status_code=403, detail="You can only delete your own messages")
-    
+
     message.is_deleted = True
     message.content = "This message was deleted"
     message.updated_at = datetime.now(timezone.utc)
-    db.commit()
-    
-    return None
+    await unindex_message_async(db, message.id)
+    await db.commit()
 
+    return None
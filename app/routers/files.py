@@ -3,18 +3,24 @@ File upload and download routes
 """
 import os
 import uuid
+import hashlib
+import time
 from pathlib import Path
+import aiofiles
+import aiofiles.os
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query, Request
 from fastapi.responses import FileResponse
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, exists
 from typing import Optional
 from jose import JWTError, jwt
 from app.database import get_db
-from app.models import Message, Conversation, Room, MessageType, User
+from app.models import Message, Conversation, Room, RoomMember, MessageType, User
 from app.auth import SECRET_KEY, ALGORITHM, get_current_active_user
+from app.search import index_message
+from app.encryption import encrypt_message
 
 router = APIRouter(prefix="/api/files", tags=["files"])
 
@@ -30,6 +36,7 @@ ALLOWED_FILE_TYPES = {
     "text/plain", "application/zip"
 }
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+UPLOAD_CHUNK_SIZE = 64 * 1024  # Streamed-upload chunk size
 
 
 @router.post("/upload")
@@ -75,38 +82,72 @@ async def upload_file(
             raise HTTPException(status_code=404, detail="Conversation not found")
     
     if room_id:
-        room = db.query(Room).filter(Room.id == room_id).first()
-        if not room:
+        # One query validates the room and returns membership alongside it
+        row = (
+            db.query(
+                Room,
+                exists().where(
+                    and_(
+                        RoomMember.room_id == Room.id,
+                        RoomMember.user_id == current_user.id
+                    )
+                )
+            )
+            .filter(Room.id == room_id)
+            .first()
+        )
+        if not row:
             raise HTTPException(status_code=404, detail="Room not found")
+        room, is_member = row
+        if not is_member:
+            raise HTTPException(status_code=403, detail="You are not a member of this room")
     
     # Validate file
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
     
-    # Check file size
-    contents = await file.read()
-    if len(contents) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="File too large (max 10MB)")
-    
     # Determine message type
     message_type = MessageType.FILE
     if file.content_type in ALLOWED_IMAGE_TYPES:
         message_type = MessageType.IMAGE
-    
-    # Save file
+
+    # Stream the upload to a temp file in chunks instead of buffering the
+    # whole file in memory; size is enforced as the chunks arrive and the
+    # content is hashed on the way through (SHA-NI makes this ~free)
     file_ext = Path(file.filename).suffix
-    file_id = str(uuid.uuid4())
-    file_path = UPLOAD_DIR / f"{file_id}{file_ext}"
-    
-    with open(file_path, "wb") as f:
-        f.write(contents)
+    tmp_path = UPLOAD_DIR / f"tmp-{uuid.uuid4()}{file_ext}"
+    hasher = hashlib.sha256()
+
+    file_size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                file_size += len(chunk)
+                if file_size > MAX_FILE_SIZE:
+                    raise HTTPException(status_code=400, detail="File too large (max 10MB)")
+                hasher.update(chunk)
+                await f.write(chunk)
+
+        # Content-addressed storage: the digest names the file on disk, so a
+        # duplicate upload just references the bytes already there
+        file_id = hasher.hexdigest()
+        file_path = UPLOAD_DIR / f"{file_id}{file_ext}"
+        if await aiofiles.os.path.exists(file_path):
+            await aiofiles.os.remove(tmp_path)
+        else:
+            await aiofiles.os.rename(tmp_path, file_path)
+    finally:
+        # Whatever went wrong - client disconnect mid-read, the size limit,
+        # a rename failure - the temp file must not be leaked. On success
+        # the rename (or duplicate removal) has already consumed it.
+        if await aiofiles.os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
     
     # Create message
     message_content = f"📎 {file.filename}"
     # Convert encrypt string to boolean
     is_encrypted = encrypt and encrypt.lower() == "true"
     if is_encrypted:
-        from app.encryption import encrypt_message
         message_content = encrypt_message(message_content)
     
     db_message = Message(
@@ -116,12 +157,14 @@ async def upload_file(
         conversation_id=conversation_id,
         room_id=room_id,
         file_path=str(file_path),
+        file_id=file_id,
         file_name=file.filename,
-        file_size=len(contents),
+        file_size=file_size,
         is_encrypted=is_encrypted
     )
     db.add(db_message)
-    
+    index_message(db, db_message, f"📎 {file.filename}")
+
     if conversation_id:
         conv.last_message_at = func.now()
     if room_id:
@@ -137,15 +180,43 @@ async def upload_file(
         "message_id": db_message.id,
         "file_path": file_url,
         "file_name": file.filename,
-        "file_size": len(contents),
+        "file_size": file_size,
         "message_type": message_type.value
     }
 
 
+# Verified-token cache: sha256(token) -> (user_id, token exp, cached at).
+# Repeated downloads with the same token skip the signature verification and
+# the username SELECT; only the single-row PK fetch remains. Invalid tokens
+# are never cached, and entries expire with the token's own exp claim.
+_TOKEN_CACHE_TTL = 60  # seconds a verification result stays fresh
+_TOKEN_CACHE_MAX = 10_000
+_token_cache: dict = {}
+
+
+def invalidate_token(token: str):
+    """Drop a token's cached verification (e.g. on logout)"""
+    _token_cache.pop(hashlib.sha256(token.encode()).digest(), None)
+
+
 async def get_user_from_token(token: str, db: Session) -> Optional[User]:
     """Helper function to get user from JWT token"""
     if not token:
         return None
+
+    digest = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    cached = _token_cache.get(digest)
+    if cached:
+        user_id, token_exp, cached_at = cached
+        if now < token_exp and now - cached_at < _TOKEN_CACHE_TTL:
+            # Re-attach via PK fetch to avoid holding stale ORM identities
+            user = db.get(User, user_id)
+            if user and user.is_active:
+                return user
+        else:
+            _token_cache.pop(digest, None)
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -153,6 +224,13 @@ async def get_user_from_token(token: str, db: Session) -> Optional[User]:
             return None
         user = db.query(User).filter(User.username == username).first()
         if user and user.is_active:
+            if len(_token_cache) >= _TOKEN_CACHE_MAX:
+                _token_cache.clear()
+            _token_cache[digest] = (
+                user.id,
+                payload.get("exp", now + _TOKEN_CACHE_TTL),
+                now
+            )
             return user
     except JWTError as e:
         print(f"JWT Error: {e}")
@@ -198,39 +276,45 @@ async def download_file(
     """Download a file - accepts token in query parameter or Authorization header"""
     # Authenticate user
     current_user = await get_current_user_optional(request, token, db)
-    
-    # Find file by ID in filename
-    file_path = None
-    for f in UPLOAD_DIR.glob(f"{file_id}*"):
-        file_path = f
-        break
-    
-    if not file_path or not file_path.exists():
+
+    # Indexed equality lookup on the dedicated file_id column; rows written
+    # before the column existed fall back to the old LIKE match. Duplicate
+    # uploads share one content digest, so several messages can carry the
+    # same file_id - access is granted if any of them is reachable
+    messages = db.query(Message).filter(Message.file_id == file_id).all()
+    if not messages:
+        messages = db.query(Message).filter(Message.file_path.like(f"%{file_id}%")).limit(20).all()
+    if not messages:
         raise HTTPException(status_code=404, detail="File not found")
-    
-    # Verify user has access (check if they're part of conversation/room with this file)
-    message = db.query(Message).filter(Message.file_path.like(f"%{file_id}%")).first()
+
+    # Check access before touching the filesystem
+    message = None
+    for candidate in messages:
+        if candidate.conversation_id:
+            conv = db.query(Conversation).filter(Conversation.id == candidate.conversation_id).first()
+            if conv and (conv.user1_id == current_user.id or conv.user2_id == current_user.id):
+                message = candidate
+                break
+        elif candidate.room_id:
+            # Check if user is a member of the room
+            is_member = db.query(
+                exists().where(
+                    and_(RoomMember.room_id == candidate.room_id, RoomMember.user_id == current_user.id)
+                )
+            ).scalar()
+            if is_member:
+                message = candidate
+                break
+
     if not message:
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    # Check access
-    has_access = False
-    if message.conversation_id:
-        conv = db.query(Conversation).filter(Conversation.id == message.conversation_id).first()
-        if conv and (conv.user1_id == current_user.id or conv.user2_id == current_user.id):
-            has_access = True
-    elif message.room_id:
-        # Check if user is a member of the room
-        from app.models import RoomMember
-        is_member = db.query(RoomMember).filter(
-            and_(RoomMember.room_id == message.room_id, RoomMember.user_id == current_user.id)
-        ).first()
-        if is_member:
-            has_access = True
-    
-    if not has_access:
         raise HTTPException(status_code=403, detail="Access denied")
-    
+
+    file_path = Path(message.file_path)
+    if not file_path.exists():
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # FileResponse serves via os.sendfile, so the bytes never pass through
+    # Python
     return FileResponse(
         path=file_path,
         filename=message.file_name or file_path.name,
@@ -1,117 +1,144 @@
 """
 Group room routes for multi-user chats
+
+Runs on the async engine (see app/database.py), so room queries await on
+the event loop instead of occupying threadpool workers.
 """
 from typing import List
+import os
+from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func, and_, or_
-from app.database import get_db
-from app.models import User, Room, Message, MessageStatus, RoomMember
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy import desc, func, and_, or_, select, update, exists
+from app.database import get_async_db
+from app.models import User, Room, Message, MessageStatus, RoomMember, MessageSearchEntry
 from app.schemas import RoomCreate, RoomResponse, MessageResponse, MessageCreate, RoomMemberResponse, AddMemberRequest
 from app.auth import get_current_active_user
+from app.search import index_message_async
+from app.encryption import encrypt_message, decrypt_message, decrypt_messages
 
 router = APIRouter(prefix="/api/rooms", tags=["rooms"])
 
 
 @router.get("/", response_model=List[RoomResponse])
-def get_rooms(
+async def get_rooms(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get all rooms the current user is a member of"""
-    # Get room IDs where user is a member
-    member_room_ids = (
-        db.query(RoomMember.room_id)
-        .filter(RoomMember.user_id == current_user.id)
-        .subquery()
+    # Member counts ride along in the page query as a correlated aggregate,
+    # so one plan computes rooms + counts in a single round trip (LATERAL
+    # would need PostgreSQL; the correlated COUNT is portable to SQLite)
+    member_count_col = (
+        select(func.count(RoomMember.id))
+        .where(RoomMember.room_id == Room.id)
+        .correlate(Room)
+        .scalar_subquery()
     )
-    
-    rooms = (
-        db.query(Room)
-        .filter(Room.id.in_(db.query(member_room_ids.c.room_id)))
-        .order_by(desc(Room.last_message_at))
-        .offset(skip)
-        .limit(limit)
-        .all()
+
+    # Page of rooms with the creator eager-loaded; membership via JOIN
+    rows = (
+        await db.execute(
+            select(Room, member_count_col.label("member_count"))
+            .options(joinedload(Room.creator))
+            .join(RoomMember, RoomMember.room_id == Room.id)
+            .where(RoomMember.user_id == current_user.id)
+            .order_by(desc(Room.last_message_at))
+            .offset(skip)
+            .limit(limit)
+        )
+    ).all()
+
+    if not rows:
+        return []
+    rooms = [room for room, _ in rows]
+    member_counts = {room.id: count for room, count in rows}
+    room_ids = [room.id for room in rooms]
+
+    # One query for all last messages: max(id) per room, then the rows
+    last_msg_subq = (
+        select(func.max(Message.id))
+        .where(Message.room_id.in_(room_ids))
+        .group_by(Message.room_id)
     )
-    
+    last_messages = {
+        msg.room_id: msg
+        for msg in (
+            await db.execute(select(Message).where(Message.id.in_(last_msg_subq)))
+        ).scalars().all()
+    }
+
     result = []
+    encrypted_previews = []  # (entry index, ciphertext) pairs for batch decryption
     for room in rooms:
-        # Get last message
-        last_message = (
-            db.query(Message)
-            .filter(Message.room_id == room.id)
-            .order_by(desc(Message.created_at))
-            .first()
-        )
-        
-        # Decrypt last message if encrypted (for preview display)
+        last_message = last_messages.get(room.id)
+
+        # Preview content; encrypted previews are collected and decrypted in one batch
         last_message_content = None
         if last_message and not last_message.is_deleted:
             last_message_content = last_message.content
             if last_message.is_encrypted:
-                try:
-                    from app.encryption import decrypt_message
-                    last_message_content = decrypt_message(last_message.content)
-                except:
-                    # If decryption fails, show placeholder
-                    last_message_content = "🔒 Encrypted message"
-        
-        # Count actual members
-        member_count = (
-            db.query(func.count(RoomMember.id))
-            .filter(RoomMember.room_id == room.id)
-            .scalar() or 0
-        )
-        
+                encrypted_previews.append((len(result), last_message.content))
+
         result.append(RoomResponse(
             id=room.id,
             name=room.name,
             description=room.description,
             creator_id=room.creator_id,
             creator_username=room.creator.username,
-            member_count=member_count,
+            member_count=member_counts.get(room.id, 0),
             is_member=True,  # User is a member (they're in the list)
             last_message=last_message_content,
             last_message_at=last_message.created_at if last_message else room.created_at,
             created_at=room.created_at
         ))
-    
+
+    if encrypted_previews:
+        decrypted = await run_in_threadpool(
+            decrypt_messages, [c for _, c in encrypted_previews]
+        )
+        for (idx, _), plaintext in zip(encrypted_previews, decrypted):
+            result[idx].last_message = plaintext
+
     return result
 
 
 @router.post("/", response_model=RoomResponse, status_code=status.HTTP_201_CREATED)
-def create_room(
+async def create_room(
     room_data: RoomCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Create a new group room - creator is automatically added as a member"""
+    # created_at is set here rather than by the server default: the async
+    # session cannot lazy-load it after the commit
     db_room = Room(
         name=room_data.name,
         description=room_data.description,
-        creator_id=current_user.id
+        creator_id=current_user.id,
+        created_at=datetime.now(timezone.utc)
     )
     db.add(db_room)
-    db.flush()  # Flush to get the room ID
-    
+    await db.flush()  # Flush to get the room ID
+
     # Add creator as first member
     creator_member = RoomMember(
         room_id=db_room.id,
         user_id=current_user.id
     )
     db.add(creator_member)
-    db.commit()
-    db.refresh(db_room)
-    
+    await db.commit()
+
     return RoomResponse(
         id=db_room.id,
         name=db_room.name,
         description=db_room.description,
         creator_id=db_room.creator_id,
-        creator_username=db_room.creator.username,
+        creator_username=current_user.username,
         member_count=1,
         is_member=True,
         last_message=None,
@@ -120,89 +147,216 @@ def create_room(
     )
 
 
+@router.get("/search/messages", response_model=List[dict])
+async def search_room_messages(
+    q: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Search for messages containing the query text in rooms
+
+    Runs against the write-time search index (see app/search.py), so no
+    message is loaded or decrypted here. Registered before the
+    /{room_id}/messages route so the literal path wins the match.
+    """
+    if len(q) < 1:
+        return []
+
+    # Get all rooms the user is a member of
+    user_room_ids = (
+        await db.execute(
+            select(RoomMember.room_id)
+            .where(RoomMember.user_id == current_user.id)
+        )
+    ).scalars().all()
+
+    if not user_room_ids:
+        return []
+
+    # Server-side match + per-room count in one indexed query
+    matches = (
+        await db.execute(
+            select(
+                MessageSearchEntry.room_id,
+                func.count(MessageSearchEntry.id).label("match_count")
+            )
+            .where(
+                and_(
+                    MessageSearchEntry.room_id.in_(user_room_ids),
+                    MessageSearchEntry.content.contains(q.lower())
+                )
+            )
+            .group_by(MessageSearchEntry.room_id)
+        )
+    ).all()
+
+    match_counts = dict(matches)
+
+    # Messages written before the search index existed have no index row.
+    # Unencrypted ones are matched server-side; only the encrypted remainder
+    # falls back to a bounded decrypt-and-scan.
+    indexed_ids = select(MessageSearchEntry.message_id)
+    legacy_plain = (
+        await db.execute(
+            select(
+                Message.room_id,
+                func.count(Message.id)
+            )
+            .where(
+                and_(
+                    Message.room_id.in_(user_room_ids),
+                    Message.is_deleted == False,
+                    Message.is_encrypted == False,
+                    ~Message.id.in_(indexed_ids),
+                    Message.content.ilike(f"%{q}%")
+                )
+            )
+            .group_by(Message.room_id)
+        )
+    ).all()
+    for room_id, count in legacy_plain:
+        match_counts[room_id] = match_counts.get(room_id, 0) + count
+
+    legacy_encrypted = (
+        await db.execute(
+            select(Message.room_id, Message.content)
+            .where(
+                and_(
+                    Message.room_id.in_(user_room_ids),
+                    Message.is_deleted == False,
+                    Message.is_encrypted == True,
+                    ~Message.id.in_(indexed_ids)
+                )
+            )
+            .order_by(desc(Message.created_at))
+            .limit(500)
+        )
+    ).all()
+    if legacy_encrypted:
+        plaintexts = await run_in_threadpool(
+            decrypt_messages, [content for _, content in legacy_encrypted]
+        )
+        for (room_id, _), plaintext in zip(legacy_encrypted, plaintexts):
+            if q.lower() in plaintext.lower():
+                match_counts[room_id] = match_counts.get(room_id, 0) + 1
+
+    if not match_counts:
+        return []
+
+    # One IN query for the room rows instead of one get() per room
+    rooms = (
+        await db.execute(select(Room).where(Room.id.in_(match_counts)))
+    ).scalars().all()
+
+    return [
+        {
+            "type": "room",
+            "id": room.id,
+            "name": room.name,
+            "match_count": match_counts[room.id]
+        }
+        for room in rooms
+    ]
+
+
 @router.get("/{room_id}/messages", response_model=List[MessageResponse])
-def get_room_messages(
+async def get_room_messages(
     room_id: int,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get messages for a room - only members can access"""
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = await db.get(Room, room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
-    
-    # Check if user is a member
-    is_member = db.query(RoomMember).filter(
-        and_(RoomMember.room_id == room_id, RoomMember.user_id == current_user.id)
-    ).first()
-    
+
+    # Check if user is a member; EXISTS avoids materializing a RoomMember
+    # row just to test truthiness
+    is_member = (
+        await db.execute(
+            select(
+                exists().where(
+                    and_(RoomMember.room_id == room_id, RoomMember.user_id == current_user.id)
+                )
+            )
+        )
+    ).scalar()
+
     if not is_member:
         raise HTTPException(status_code=403, detail="You are not a member of this room")
-    
-    # Mark messages as delivered/read
-    db.query(Message).filter(
-        Message.room_id == room_id,
-        Message.sender_id != current_user.id,
-        Message.status == MessageStatus.SENT
-    ).update({Message.status: MessageStatus.DELIVERED})
-    
-    db.query(Message).filter(
-        Message.room_id == room_id,
-        Message.sender_id != current_user.id,
-        Message.status == MessageStatus.DELIVERED
-    ).update({Message.status: MessageStatus.READ})
-    
-    db.commit()
-    
-    messages = (
-        db.query(Message)
-        .filter(Message.room_id == room_id)
-        .order_by(Message.created_at)
-        .offset(skip)
-        .limit(limit)
-        .all()
+
+    # Mark other members' messages as read; the viewer has the room open, so
+    # SENT and DELIVERED collapse to READ in a single UPDATE
+    await db.execute(
+        update(Message)
+        .where(
+            and_(
+                Message.room_id == room_id,
+                Message.sender_id != current_user.id,
+                Message.status.in_([MessageStatus.SENT, MessageStatus.DELIVERED])
+            )
+        )
+        .values(status=MessageStatus.READ)
+        .execution_options(synchronize_session=False)
     )
-    
+
+    await db.commit()
+
+    # Eager-load sender and reply-parent chains so the loop below issues no
+    # per-message queries
+    messages = (
+        await db.execute(
+            select(Message)
+            .options(
+                joinedload(Message.sender),
+                joinedload(Message.reply_to).joinedload(Message.sender)
+            )
+            .where(Message.room_id == room_id)
+            .order_by(Message.created_at)
+            .offset(skip)
+            .limit(limit)
+        )
+    ).scalars().all()
+
+    # Responses are built from computed locals; the loaded instances are
+    # never mutated, so an encrypted parent earlier in the page still holds
+    # its ciphertext when a reply row reads it back
     result = []
     for msg in messages:
         # Decrypt content if encrypted
         display_content = msg.content
         if msg.is_encrypted:
-            from app.encryption import decrypt_message
             display_content = decrypt_message(msg.content)
-        
+
         # Build file URL if file exists
         file_url = None
         if msg.file_path:
-            import os
             file_name = os.path.basename(msg.file_path)
             file_id = os.path.splitext(file_name)[0]
             file_url = f"/api/files/{file_id}"
-        
-        # Get reply info if exists
+
+        # Get reply info if exists (loaded eagerly above)
         reply_to_content = None
         reply_to_sender = None
         if msg.reply_to_id:
-            reply_msg = db.query(Message).filter(Message.id == msg.reply_to_id).first()
+            reply_msg = msg.reply_to
             if reply_msg:
                 reply_to_sender = reply_msg.sender.username
                 if reply_msg.is_deleted:
                     reply_to_content = "This message was deleted"
                 elif reply_msg.is_encrypted:
                     try:
-                        from app.encryption import decrypt_message
                         reply_to_content = decrypt_message(reply_msg.content)
                     except:
                         reply_to_content = reply_msg.content
                 else:
                     reply_to_content = reply_msg.content[:50]  # Preview
-        
+
         result.append(MessageResponse(
             id=msg.id,
             content=display_content if not msg.is_deleted else "This message was deleted",
-            conversation_id=None,
             room_id=msg.room_id,
             sender_id=msg.sender_id,
             sender_username=msg.sender.username,
@@ -220,50 +374,56 @@ def get_room_messages(
             updated_at=msg.updated_at,
             created_at=msg.created_at
         ))
-    
+
     return result
 
 
 @router.post("/{room_id}/messages", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
-def send_room_message(
+async def send_room_message(
     room_id: int,
     message_data: dict,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Send a message to a room"""
-    from pydantic import BaseModel
-    from typing import Optional
-    
     # Parse message data
     content = message_data.get("content", "").strip()
     if not content:
         raise HTTPException(status_code=400, detail="Message content cannot be empty")
-    
-    room = db.query(Room).filter(Room.id == room_id).first()
+
+    room = await db.get(Room, room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
-    
-    # Check if user is a member
-    is_member = db.query(RoomMember).filter(
-        and_(RoomMember.room_id == room_id, RoomMember.user_id == current_user.id)
-    ).first()
-    
+
+    # Check if user is a member; EXISTS avoids materializing a RoomMember
+    # row just to test truthiness
+    is_member = (
+        await db.execute(
+            select(
+                exists().where(
+                    and_(RoomMember.room_id == room_id, RoomMember.user_id == current_user.id)
+                )
+            )
+        )
+    ).scalar()
+
     if not is_member:
         raise HTTPException(status_code=403, detail="You are not a member of this room")
-    
-    # Handle encryption if requested
+
+    # Handle encryption if requested; the original plaintext is kept for the
+    # response and the search index, so nothing is decrypted on the way out
     is_encrypted = message_data.get("encrypt", False)
     message_type = message_data.get("message_type", "text")
-    
+
+    plaintext = content
     if is_encrypted:
-        from app.encryption import encrypt_message
         content = encrypt_message(content)
-    
+
     # Get reply_to_id if provided
     reply_to_id = message_data.get("reply_to_id")
-    
-    # Create message
+
+    # Create message; created_at set here so the async session never has to
+    # lazy-load the server default after commit
     db_message = Message(
         content=content,
         message_type=message_type,
@@ -271,65 +431,66 @@ def send_room_message(
         room_id=room_id,
         status=MessageStatus.SENT,
         is_encrypted=is_encrypted,
-        reply_to_id=reply_to_id
+        reply_to_id=reply_to_id,
+        created_at=datetime.now(timezone.utc)
     )
     db.add(db_message)
-    
+    await index_message_async(db, db_message, plaintext)
+
     # Update room's last_message_at
-    from sqlalchemy.sql import func
     room.last_message_at = func.now()
-    
-    db.commit()
-    db.refresh(db_message)
-    
-    # Decrypt for response
-    display_content = db_message.content
-    if is_encrypted:
-        from app.encryption import decrypt_message
-        display_content = decrypt_message(db_message.content)
-    
+
+    await db.commit()
+
+    display_content = plaintext
+
     # Build file URL if file exists
     file_url = None
     if db_message.file_path:
-        import os
         file_name = os.path.basename(db_message.file_path)
         file_id = os.path.splitext(file_name)[0]
         file_url = f"/api/files/{file_id}"
-    
+
     # Get reply info if exists
     reply_to_content = None
     reply_to_sender = None
     if db_message.reply_to_id:
-        reply_msg = db.query(Message).filter(Message.id == db_message.reply_to_id).first()
+        reply_msg = (
+            await db.execute(
+                select(Message)
+                .options(joinedload(Message.sender))
+                .where(Message.id == db_message.reply_to_id)
+            )
+        ).scalars().first()
         if reply_msg:
             reply_to_sender = reply_msg.sender.username
             if reply_msg.is_deleted:
                 reply_to_content = "This message was deleted"
             elif reply_msg.is_encrypted:
                 try:
-                    from app.encryption import decrypt_message
                     reply_to_content = decrypt_message(reply_msg.content)
                 except:
                     reply_to_content = reply_msg.content
             else:
                 reply_to_content = reply_msg.content[:50]  # Preview
-    
+
+    # Response built from locals; the committed instance keeps its stored
+    # ciphertext so nothing dirty lingers in the session
     return MessageResponse(
         id=db_message.id,
         content=display_content,
-        conversation_id=None,
-        room_id=db_message.room_id,
-        sender_id=db_message.sender_id,
-        sender_username=db_message.sender.username,
-        status=db_message.status.value,
-        message_type=db_message.message_type.value,
+        room_id=room_id,
+        sender_id=current_user.id,
+        sender_username=current_user.username,
+        status=MessageStatus.SENT.value,
+        message_type=message_type,
         file_path=file_url,
         file_name=db_message.file_name,
         file_size=db_message.file_size,
-        is_encrypted=db_message.is_encrypted,
+        is_encrypted=is_encrypted,
         is_edited=db_message.is_edited,
         is_deleted=db_message.is_deleted,
-        reply_to_id=db_message.reply_to_id,
+        reply_to_id=reply_to_id,
         reply_to_content=reply_to_content,
         reply_to_sender=reply_to_sender,
         updated_at=db_message.updated_at,
@@ -338,30 +499,39 @@ def send_room_message(
 
 
 @router.get("/{room_id}/members", response_model=List[RoomMemberResponse])
-def get_room_members(
+async def get_room_members(
     room_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get all members of a room"""
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = await db.get(Room, room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
-    
-    # Check if user is a member
-    is_member = db.query(RoomMember).filter(
-        and_(RoomMember.room_id == room_id, RoomMember.user_id == current_user.id)
-    ).first()
-    
+
+    # Check if user is a member; EXISTS avoids materializing a RoomMember
+    # row just to test truthiness
+    is_member = (
+        await db.execute(
+            select(
+                exists().where(
+                    and_(RoomMember.room_id == room_id, RoomMember.user_id == current_user.id)
+                )
+            )
+        )
+    ).scalar()
+
     if not is_member:
         raise HTTPException(status_code=403, detail="You are not a member of this room")
-    
+
     members = (
-        db.query(RoomMember)
-        .filter(RoomMember.room_id == room_id)
-        .all()
-    )
-    
+        await db.execute(
+            select(RoomMember)
+            .options(joinedload(RoomMember.user))
+            .where(RoomMember.room_id == room_id)
+        )
+    ).scalars().all()
+
     result = []
     for member in members:
         result.append(RoomMemberResponse(
@@ -371,160 +541,98 @@ def get_room_members(
             email=member.user.email,
             joined_at=member.joined_at
         ))
-    
+
     return result
 
 
 @router.post("/{room_id}/members", response_model=RoomMemberResponse, status_code=status.HTTP_201_CREATED)
-def add_member_to_room(
+async def add_member_to_room(
     room_id: int,
     member_data: AddMemberRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Add a user to a room - only room creator can add members"""
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = await db.get(Room, room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
-    
+
     # Check if current user is the creator
     if room.creator_id != current_user.id:
         raise HTTPException(status_code=403, detail="Only the room creator can add members")
-    
+
     # Check if user to add exists
-    user_to_add = db.query(User).filter(User.id == member_data.user_id).first()
+    user_to_add = await db.get(User, member_data.user_id)
     if not user_to_add:
         raise HTTPException(status_code=404, detail="User not found")
-    
+
     # Check if user is already a member
-    existing_member = db.query(RoomMember).filter(
-        and_(RoomMember.room_id == room_id, RoomMember.user_id == member_data.user_id)
-    ).first()
-    
+    existing_member = (
+        await db.execute(
+            select(
+                exists().where(
+                    and_(RoomMember.room_id == room_id, RoomMember.user_id == member_data.user_id)
+                )
+            )
+        )
+    ).scalar()
+
     if existing_member:
         raise HTTPException(status_code=400, detail="User is already a member of this room")
-    
-    # Add member
+
+    # Add member; joined_at set here so the async session never has to
+    # lazy-load the server default after commit
     new_member = RoomMember(
         room_id=room_id,
-        user_id=member_data.user_id
+        user_id=member_data.user_id,
+        joined_at=datetime.now(timezone.utc)
     )
     db.add(new_member)
-    db.commit()
-    db.refresh(new_member)
-    
+    await db.commit()
+
     return RoomMemberResponse(
         id=new_member.id,
         user_id=new_member.user_id,
-        username=new_member.user.username,
-        email=new_member.user.email,
+        username=user_to_add.username,
+        email=user_to_add.email,
         joined_at=new_member.joined_at
     )
 
 
 @router.delete("/{room_id}/members/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def remove_member_from_room(
+async def remove_member_from_room(
     room_id: int,
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Remove a user from a room - only room creator can remove members"""
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = await db.get(Room, room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
-    
+
     # Check if current user is the creator
     if room.creator_id != current_user.id:
         raise HTTPException(status_code=403, detail="Only the room creator can remove members")
-    
+
     # Find and remove member
-    member = db.query(RoomMember).filter(
-        and_(RoomMember.room_id == room_id, RoomMember.user_id == user_id)
-    ).first()
-    
+    member = (
+        await db.execute(
+            select(RoomMember)
+            .where(and_(RoomMember.room_id == room_id, RoomMember.user_id == user_id))
+        )
+    ).scalars().first()
+
     if not member:
         raise HTTPException(status_code=404, detail="User is not a member of this room")
-    
+
     # Don't allow removing the creator
     if user_id == room.creator_id:
         raise HTTPException(status_code=400, detail="Cannot remove the room creator")
-    
-    db.delete(member)
-    db.commit()
-    
-    return None
 
+    await db.delete(member)
+    await db.commit()
+
+    return None
 
-@router.get("/search/messages", response_model=List[dict])
-def search_room_messages(
-    q: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
-):
-    """Search for messages containing the query text in rooms"""
-    if len(q) < 1:
-        return []
-    
-    # Get all rooms the user is a member of
-    user_room_ids = [
-        member.room_id for member in db.query(RoomMember.room_id)
-        .filter(RoomMember.user_id == current_user.id)
-        .all()
-    ]
-    
-    if not user_room_ids:
-        return []
-    
-    # Search messages in those rooms
-    # Get all messages first, then decrypt and search in plain text
-    all_messages = (
-        db.query(Message)
-        .filter(
-            and_(
-                Message.room_id.in_(user_room_ids),
-                Message.is_deleted == False
-            )
-        )
-        .order_by(desc(Message.created_at))
-        .limit(500)  # Get more messages to search through
-        .all()
-    )
-    
-    from app.encryption import decrypt_message
-    matching_messages = []
-    
-    for msg in all_messages:
-        # Always decrypt if encrypted, then search in plain text
-        search_content = msg.content
-        if msg.is_encrypted:
-            try:
-                # Decrypt the message to get plain text
-                search_content = decrypt_message(msg.content)
-            except Exception as e:
-                # If decryption fails, skip this message (can't search encrypted content)
-                continue
-        
-        # Search in plain text content (case-insensitive)
-        if q.lower() in search_content.lower():
-            matching_messages.append(msg)
-    
-    # Group by room_id and return unique room IDs
-    room_ids = set()
-    for msg in matching_messages:
-        room_ids.add(msg.room_id)
-    
-    # Get room details
-    result = []
-    for room_id in room_ids:
-        room = db.query(Room).filter(Room.id == room_id).first()
-        if room:
-            result.append({
-                "type": "room",
-                "id": room.id,
-                "name": room.name,
-                "match_count": len([m for m in matching_messages if m.room_id == room_id])
-            })
-    
-    return result
 
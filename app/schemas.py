@@ -1,7 +1,7 @@
 """
 Pydantic schemas for request/response validation
 """
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from datetime import datetime
 from typing import Optional, List
 
@@ -27,8 +27,7 @@ class UserResponse(UserBase):
     created_at: datetime
     last_seen: Optional[datetime] = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Room Schemas (Group Rooms)
@@ -51,8 +50,7 @@ class RoomResponse(RoomBase):
     last_message_at: Optional[datetime] = None
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class RoomMemberResponse(BaseModel):
@@ -62,8 +60,7 @@ class RoomMemberResponse(BaseModel):
     email: str
     joined_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class AddMemberRequest(BaseModel):
@@ -83,8 +80,7 @@ class ConversationResponse(BaseModel):
     other_user_online: Optional[bool] = False
     other_user_last_seen: Optional[datetime] = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Message Schemas
@@ -119,8 +115,7 @@ class MessageResponse(MessageBase):
     updated_at: Optional[datetime] = None
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # WebSocket Message Schema
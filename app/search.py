@@ -0,0 +1,75 @@
+"""
+Write-time message search index helpers
+
+Message bodies may be stored encrypted, so substring search cannot run
+against the messages table directly. Writers mirror the plaintext
+(lowercased) into message_search_index via index_message(); the search
+endpoints then match with a plain SQL LIKE instead of loading and
+decrypting messages in Python.
+"""
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.models import Message, MessageSearchEntry
+
+
+def index_message(db: Session, message: Message, plaintext: str):
+    """Add or update the search-index row for a message (call before commit)"""
+    if not plaintext:
+        return
+    entry = None
+    if message.id:
+        entry = (
+            db.query(MessageSearchEntry)
+            .filter(MessageSearchEntry.message_id == message.id)
+            .first()
+        )
+    if entry:
+        entry.content = plaintext.lower()
+    else:
+        db.add(MessageSearchEntry(
+            message=message,
+            conversation_id=message.conversation_id,
+            room_id=message.room_id,
+            content=plaintext.lower()
+        ))
+
+
+def unindex_message(db: Session, message_id: int):
+    """Remove the search-index row for a deleted message"""
+    (
+        db.query(MessageSearchEntry)
+        .filter(MessageSearchEntry.message_id == message_id)
+        .delete(synchronize_session=False)
+    )
+
+
+async def index_message_async(db: AsyncSession, message: Message, plaintext: str):
+    """index_message for the async-session routers"""
+    if not plaintext:
+        return
+    entry = None
+    if message.id:
+        entry = (
+            await db.execute(
+                select(MessageSearchEntry)
+                .where(MessageSearchEntry.message_id == message.id)
+            )
+        ).scalars().first()
+    if entry:
+        entry.content = plaintext.lower()
+    else:
+        db.add(MessageSearchEntry(
+            message=message,
+            conversation_id=message.conversation_id,
+            room_id=message.room_id,
+            content=plaintext.lower()
+        ))
+
+
+async def unindex_message_async(db: AsyncSession, message_id: int):
+    """unindex_message for the async-session routers"""
+    await db.execute(
+        delete(MessageSearchEntry)
+        .where(MessageSearchEntry.message_id == message_id)
+    )
@@ -1,79 +1,200 @@
 """
 WebSocket handlers for real-time messaging (WhatsApp-like)
 """
-from fastapi import WebSocket, WebSocketDisconnect, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import asyncio
+
+from fastapi import WebSocket, WebSocketDisconnect, HTTPException, status
+from sqlalchemy import lambda_stmt, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timezone
-from typing import Dict, Set
-import json
+from typing import Dict, List, Optional, Set, Tuple, Union
+import hashlib
+import time
+import msgspec
+import orjson
 from jose import jwt
-import os
 
-from app.database import get_db
 from app.models import User, Conversation, Message, MessageStatus
 from app.auth import SECRET_KEY, ALGORITHM
+from app.encryption import encrypt_message
+from app.search import index_message_async
+
+# Connect-time read-marking as a prepared Core statement: no ORM compilation
+# or enum coercion per connect. Status codes are the SMALLINT values from
+# MessageStatusType (SENT=0, DELIVERED=1, READ=2).
+_MARK_READ_STMT = text(
+    "UPDATE messages SET status = 2 "
+    "WHERE conversation_id = :conversation_id "
+    "AND sender_id = :sender_id "
+    "AND status IN (0, 1)"
+)
+
+# Commit coalescing: a connection holds its transaction open across a burst
+# of inbound messages and commits once per batch instead of once per message.
+# Delivery deliberately waits for that commit - durability before delivery -
+# so mid-burst a frame can sit undelivered for up to the idle window (or the
+# batch cap); in exchange, a message anyone has seen is always on disk, and a
+# connection torn down mid-window loses only frames nobody was shown.
+_COMMIT_BATCH_MAX = 16
+_COMMIT_IDLE_WINDOW = 0.005  # seconds to wait for another frame before committing
+
+# Typing indicators fire per keystroke on the client; broadcasting each one
+# is pure fan-out QPS. At most one start event per (user, conversation) per
+# interval goes through; stop events always pass so peers never see a stuck
+# indicator.
+_TYPING_MIN_INTERVAL = 0.5  # seconds between forwarded typing events
+_last_typing: Dict[Tuple[int, int], float] = {}
+
+def _connect_stmt(username: str, conversation_id: int):
+    """User + conversation-membership lookup for the connect path
+
+    lambda_stmt caches the constructed expression after the first call, so
+    repeat connects skip the select/join/where build and only swap the two
+    bound values before hitting the compiled-statement cache.
+    """
+    return lambda_stmt(
+        lambda: select(User, Conversation)
+        .join(
+            Conversation,
+            or_(Conversation.user1_id == User.id, Conversation.user2_id == User.id)
+        )
+        .where(
+            User.username == username,
+            User.is_active == True,
+            Conversation.id == conversation_id
+        )
+    )
+
+
+# Store active connections: {conversation_id: [(websocket, user_id), ...]}
+active_connections: Dict[int, List[Tuple[WebSocket, int]]] = {}
+
+# Store online users: {user_id: time.monotonic() of last activity}
+online_users: Dict[int, float] = {}
+
+
+# Inbound frames parsed straight into typed structs: one C-level pass does
+# the JSON parse, the "type" dispatch (tag_field) and the field validation,
+# replacing a dict plus repeated .get() calls per frame. Frames with an
+# unknown type fail decoding and are ignored, matching the old fall-through.
+class IncomingMessage(msgspec.Struct, tag="message", tag_field="type"):
+    content: str = ""
+    encrypt: bool = False
+    message_type: str = "text"
+
+
+class IncomingTyping(msgspec.Struct, tag="typing", tag_field="type"):
+    is_typing: bool = False
 
-# Store active connections: {conversation_id: {websocket: user_id}}
-active_connections: Dict[int, Dict[WebSocket, int]] = {}
 
-# Store online users: {user_id: timestamp}
-online_users: Dict[int, datetime] = {}
+class IncomingStatusUpdate(msgspec.Struct, tag="status_update", tag_field="type"):
+    message_id: Optional[int] = None
+    status: Optional[str] = None
+
+
+_FRAME_DECODER = msgspec.json.Decoder(
+    Union[IncomingMessage, IncomingTyping, IncomingStatusUpdate]
+)
+
+
+def _encode_payload(message) -> str:
+    """Serialize a payload once with orjson; pre-encoded frames pass through"""
+    if isinstance(message, str):
+        return message
+    return orjson.dumps(message).decode()
 
 
 class ConnectionManager:
     """Manages WebSocket connections for conversations"""
     
     def __init__(self):
-        self.active_connections: Dict[int, Dict[WebSocket, int]] = {}
-    
+        # Broadcast dominates; a packed list of (websocket, user_id) tuples
+        # iterates without hash lookups and the rare join/leave just appends
+        # or rebuilds the list
+        self.active_connections: Dict[int, List[Tuple[WebSocket, int]]] = {}
+        # Bounds concurrent in-flight sends so a huge broadcast cannot
+        # exhaust buffers/file descriptors
+        self._send_semaphore = asyncio.Semaphore(100)
+
     async def connect(self, websocket: WebSocket, conversation_id: int, user_id: int):
         """Accept a new WebSocket connection"""
         await websocket.accept()
-        if conversation_id not in self.active_connections:
-            self.active_connections[conversation_id] = {}
-        self.active_connections[conversation_id][websocket] = user_id
-    
+        self.active_connections.setdefault(conversation_id, []).append((websocket, user_id))
+
     def disconnect(self, websocket: WebSocket, conversation_id: int):
         """Remove a WebSocket connection"""
-        if conversation_id in self.active_connections:
-            if websocket in self.active_connections[conversation_id]:
-                del self.active_connections[conversation_id][websocket]
-                if not self.active_connections[conversation_id]:
-                    del self.active_connections[conversation_id]
+        connections = self.active_connections.get(conversation_id)
+        if connections is None:
+            return
+        connections[:] = [entry for entry in connections if entry[0] is not websocket]
+        if not connections:
+            del self.active_connections[conversation_id]
     
-    async def send_personal_message(self, message: dict, websocket: WebSocket):
+    async def send_personal_message(self, message, websocket: WebSocket):
         """Send a message to a specific WebSocket connection"""
-        await websocket.send_json(message)
-    
-    async def send_to_conversation(self, conversation_id: int, message: dict, exclude_websocket: WebSocket = None):
+        await websocket.send_text(_encode_payload(message))
+
+    async def send_to_conversation(self, conversation_id: int, message, exclude_websocket: WebSocket = None):
         """Send a message to all connections in a conversation"""
-        if conversation_id not in self.active_connections:
+        connections = self.active_connections.get(conversation_id)
+        if not connections:
             return
-        
-        disconnected = []
-        for websocket, user_id in self.active_connections[conversation_id].items():
-            if websocket != exclude_websocket:
+
+        # Serialize once for every recipient instead of re-encoding the same
+        # dict per socket
+        payload = _encode_payload(message)
+
+        # Fan out concurrently: the per-socket drain waits overlap instead of
+        # serializing, so one slow peer no longer delays everyone after it
+        async def safe_send(ws: WebSocket):
+            async with self._send_semaphore:
                 try:
-                    await websocket.send_json(message)
-                except:
-                    disconnected.append(websocket)
-        
+                    await ws.send_text(payload)
+                    return None
+                except Exception:
+                    return ws
+
+        targets = [ws for ws, _ in connections if ws is not exclude_websocket]
+        if not targets:
+            return
+        results = await asyncio.gather(*(safe_send(ws) for ws in targets))
+
         # Clean up disconnected websockets
-        for ws in disconnected:
-            if ws in self.active_connections[conversation_id]:
-                del self.active_connections[conversation_id][ws]
+        failed = {ws for ws in results if ws is not None}
+        if failed:
+            connections[:] = [entry for entry in connections if entry[0] not in failed]
+            if not connections:
+                self.active_connections.pop(conversation_id, None)
 
 
 manager = ConnectionManager()
 
 
+# Verified-token cache: sha256(token) -> (username, token exp). Reconnects
+# with the same token skip the HMAC verification and the base64+JSON parse;
+# expiry is still honoured because the token's own exp claim is stored and
+# checked on every hit. Invalid tokens are never cached.
+_TOKEN_CACHE_MAX = 4096
+_token_cache: Dict[bytes, tuple] = {}
+
+
 def verify_websocket_token(token: str) -> str:
     """Verify JWT token from WebSocket connection and return username"""
+    digest = hashlib.sha256(token.encode()).digest()
+    cached = _token_cache.get(digest)
+    if cached:
+        username, token_exp = cached
+        if token_exp is None or token_exp > time.time():
+            return username
+        _token_cache.pop(digest, None)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             return None
+        if len(_token_cache) >= _TOKEN_CACHE_MAX:
+            _token_cache.clear()
+        _token_cache[digest] = (username, payload.get("exp"))
         return username
     except jwt.JWTError:
         return None
@@ -83,7 +204,7 @@ async def websocket_endpoint(
     websocket: WebSocket,
     conversation_id: int,
     token: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession
 ):
     """WebSocket endpoint for real-time chat in conversations"""
     # Verify token and get user
@@ -91,30 +212,19 @@ async def websocket_endpoint(
     if not username:
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid or expired token")
         return
-    
-    user = db.query(User).filter(User.username == username).first()
-    if not user or not user.is_active:
-        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="User not found or inactive")
-        return
-    
-    # Verify conversation exists and user is part of it
-    conversation = (
-        db.query(Conversation)
-        .filter(
-            Conversation.id == conversation_id,
-            (Conversation.user1_id == user.id) | (Conversation.user2_id == user.id)
-        )
-        .first()
-    )
-    
-    if not conversation:
-        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+
+    # One joined round trip resolves the user and verifies conversation
+    # membership together instead of two sequential SELECTs
+    row = (await db.execute(_connect_stmt(username, conversation_id))).first()
+    if not row:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="User or conversation not found")
         return
-    
+    user, conversation = row
+
     # Update user's last_seen and mark as online
     user.last_seen = datetime.now(timezone.utc)
-    online_users[user.id] = datetime.now(timezone.utc)
-    db.commit()
+    online_users[user.id] = time.monotonic()
+    await db.commit()
     
     # Connect to conversation
     await manager.connect(websocket, conversation_id, user.id)
@@ -128,126 +238,180 @@ async def websocket_endpoint(
         "last_seen": user.last_seen.isoformat()
     }, exclude_websocket=websocket)
     
-    # Mark messages as delivered and read when user connects
-    
-    # Mark as delivered
-    db.query(Message).filter(
-        Message.conversation_id == conversation_id,
-        Message.sender_id == other_user_id,
-        Message.status == MessageStatus.SENT
-    ).update({Message.status: MessageStatus.DELIVERED})
-    
-    # Mark as read
-    db.query(Message).filter(
-        Message.conversation_id == conversation_id,
-        Message.sender_id == other_user_id,
-        Message.status == MessageStatus.DELIVERED
-    ).update({Message.status: MessageStatus.READ})
-    
-    db.commit()
+    # Mark messages as read when user connects. One UPDATE covers both the
+    # sent->delivered and delivered->read transitions (the intermediate state
+    # is unobservable here), riding the (conversation_id, sender_id, status)
+    # index instead of issuing two statements
+    await db.execute(_MARK_READ_STMT, {
+        "conversation_id": conversation_id,
+        "sender_id": other_user_id
+    })
+    await db.commit()
     
+    pending_writes = 0
+    pending_payloads: List[str] = []
+    next_frame = None
     try:
         while True:
             # Receive message from client
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
-            
-            if message_data.get("type") == "message":
-                content = message_data.get("content", "").strip()
-                if not content:
+            # Text frames keep the frontend's plain socket.send() working;
+            # the msgspec decoder parses the str directly
+            if next_frame is not None:
+                # Carried over from burst draining below
+                frame = next_frame
+                next_frame = None
+            else:
+                data = await websocket.receive_text()
+                try:
+                    frame = _FRAME_DECODER.decode(data)
+                except msgspec.DecodeError:
+                    # Malformed frame or unknown type tag - ignore, as the
+                    # old dict-based dispatch did
                     continue
-                
-                # Handle encryption if requested
-                is_encrypted = message_data.get("encrypt", False)
-                if is_encrypted:
-                    from app.encryption import encrypt_message
-                    content = encrypt_message(content)
+
+            # One clock read per inbound frame; every branch below reuses it
+            now = datetime.now(timezone.utc)
+            now_iso = now.isoformat()
+
+            if isinstance(frame, IncomingMessage):
+                plaintext = frame.content.strip()
+                if not plaintext:
+                    continue
+
+                # Encrypt once for storage; the plaintext stays in hand for
+                # the broadcast payload and the search index
+                is_encrypted = frame.encrypt
+                content = encrypt_message(plaintext) if is_encrypted else plaintext
                 
                 # Save message to database
+                # created_at is set client-side so no refresh SELECT is
+                # needed to read it back after the commit
                 db_message = Message(
                     content=content,
                     conversation_id=conversation_id,
                     sender_id=user.id,
                     status=MessageStatus.SENT,
                     is_encrypted=is_encrypted,
-                    message_type=message_data.get("message_type", "text")
+                    message_type=frame.message_type,
+                    created_at=now
                 )
+                # The async driver does the file I/O off the event loop, so
+                # the commit no longer stalls other connections
                 db.add(db_message)
-                
-                # Update conversation's last_message_at
-                conversation.last_message_at = datetime.now(timezone.utc)
-                db.commit()
-                db.refresh(db_message)
-                
-                # Decrypt for sending (if encrypted)
-                display_content = content
-                if is_encrypted:
-                    from app.encryption import decrypt_message
-                    display_content = decrypt_message(content)
-                
-                # Build file URL if file exists
+                conversation.last_message_at = now
+                # flush populates the autoincrement id; with created_at
+                # already known there is nothing left to refresh
+                await db.flush()
+                await index_message_async(db, db_message, plaintext)
+                pending_writes += 1
+
+                # Build file URL if file exists; the stored file_id covers new
+                # rows, plain string ops derive it from the path for old ones
                 file_url = None
                 if db_message.file_path:
-                    import os
-                    file_name = os.path.basename(db_message.file_path)
-                    file_id = os.path.splitext(file_name)[0]
+                    file_id = db_message.file_id or db_message.file_path.rsplit("/", 1)[-1].rsplit(".", 1)[0]
                     file_url = f"/api/files/{file_id}"
                 
                 # Create message payload
                 message_payload = {
                     "type": "message",
                     "id": db_message.id,
-                    "content": display_content,  # Decrypted content for display
+                    "content": plaintext,  # Readable content for display
                     "sender_username": username,
                     "sender_id": user.id,
                     "conversation_id": conversation_id,
-                    "status": db_message.status.value,
-                    "message_type": db_message.message_type.value,
+                    # A fresh message is always sent; the instance still holds
+                    # the values it was constructed with (no refresh)
+                    "status": MessageStatus.SENT.value,
+                    "message_type": frame.message_type,
                     "file_path": file_url,
                     "file_name": db_message.file_name,
                     "file_size": db_message.file_size,
                     "is_encrypted": is_encrypted,
-                    "timestamp": db_message.created_at.isoformat()
+                    "timestamp": now_iso
                 }
                 
-                # Send message to other user in conversation
-                await manager.send_to_conversation(conversation_id, message_payload, exclude_websocket=websocket)
-                
-                # Also send the full message back to sender so they can see it
-                await manager.send_personal_message(message_payload, websocket)
+                # Encode once; the same frame goes to the peer and back to
+                # the sender
+                pending_payloads.append(_encode_payload(message_payload))
+
+                # If more of the burst is already arriving, fold it into this
+                # transaction instead of paying a commit per frame
+                if pending_writes < _COMMIT_BATCH_MAX:
+                    try:
+                        data = await asyncio.wait_for(
+                            websocket.receive_text(), timeout=_COMMIT_IDLE_WINDOW
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+                    else:
+                        try:
+                            next_frame = _FRAME_DECODER.decode(data)
+                        except msgspec.DecodeError:
+                            next_frame = None
+                        if isinstance(next_frame, IncomingMessage):
+                            # Same transaction; commit and fan-out happen when
+                            # the burst ends
+                            continue
+
+                # One fsync for the whole batch; fan-out waits for it so a
+                # message the sender saw echoed is always durable
+                await db.commit()
+                pending_writes = 0
+                for payload_text in pending_payloads:
+                    # Send message to other user in conversation
+                    await manager.send_to_conversation(conversation_id, payload_text, exclude_websocket=websocket)
+                    # Also send the full message back to sender so they can see it
+                    await manager.send_personal_message(payload_text, websocket)
+                pending_payloads.clear()
             
-            elif message_data.get("type") == "typing":
+            elif isinstance(frame, IncomingTyping):
+                # Keystroke-rate start events collapse to one per interval
+                if frame.is_typing:
+                    key = (user.id, conversation_id)
+                    t = time.monotonic()
+                    if t - _last_typing.get(key, 0.0) < _TYPING_MIN_INTERVAL:
+                        continue
+                    _last_typing[key] = t
                 # Send typing indicator to other user
                 await manager.send_to_conversation(conversation_id, {
                     "type": "typing",
                     "username": username,
-                    "is_typing": message_data.get("is_typing", False),
-                    "timestamp": datetime.now(timezone.utc).isoformat()
+                    "is_typing": frame.is_typing,
+                    "timestamp": now_iso
                 }, exclude_websocket=websocket)
-            
-            elif message_data.get("type") == "status_update":
+
+            elif isinstance(frame, IncomingStatusUpdate):
                 # Update message status (delivered/read)
-                message_id = message_data.get("message_id")
-                new_status = message_data.get("status")
+                message_id = frame.message_id
+                new_status = frame.status
                 
                 if message_id and new_status:
-                    db_message = db.query(Message).filter(Message.id == message_id).first()
+                    db_message = await db.get(Message, message_id)
                     if db_message and db_message.conversation_id == conversation_id:
                         if new_status == "delivered":
                             db_message.status = MessageStatus.DELIVERED
                         elif new_status == "read":
                             db_message.status = MessageStatus.READ
-                        db.commit()
+                        # This commit also lands any coalesced message writes
+                        await db.commit()
+                        pending_writes = 0
                         
                         # Notify sender
                         await manager.send_to_conversation(conversation_id, {
                             "type": "status_update",
                             "message_id": message_id,
                             "status": new_status,
-                            "timestamp": datetime.now(timezone.utc).isoformat()
+                            "timestamp": now_iso
                         }, exclude_websocket=websocket)
     
     except WebSocketDisconnect:
+        # Land any writes still waiting on the batch window
+        if pending_writes:
+            try:
+                await db.commit()
+            except Exception:
+                pass
         manager.disconnect(websocket, conversation_id)
         # Mark user as offline
         if user.id in online_users:
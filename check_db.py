@@ -1,4 +1,6 @@
 """Quick script to check database contents"""
+from sqlalchemy import func
+
 from app.database import SessionLocal
 from app.models import User, Message, Conversation, Room
 
@@ -8,29 +10,32 @@ print("=" * 50)
 print("DATABASE STATUS CHECK")
 print("=" * 50)
 
+# Counts happen server-side and previews are capped at 5 rows, so this
+# stays cheap no matter how big the tables have grown
+
 # Check Users
-users = db.query(User).all()
-print(f"\n[OK] Users in database: {len(users)}")
-for user in users:
+user_count = db.query(func.count(User.id)).scalar()
+print(f"\n[OK] Users in database: {user_count}")
+for user in db.query(User).order_by(User.id.desc()).limit(5):
     print(f"   - {user.username} ({user.email}) - ID: {user.id}")
 
 # Check Conversations
-conversations = db.query(Conversation).all()
-print(f"\n[OK] Conversations in database: {len(conversations)}")
-for conv in conversations:
+conversation_count = db.query(func.count(Conversation.id)).scalar()
+print(f"\n[OK] Conversations in database: {conversation_count}")
+for conv in db.query(Conversation).order_by(Conversation.id.desc()).limit(5):
     print(f"   - Conversation ID: {conv.id} (User1: {conv.user1_id}, User2: {conv.user2_id})")
 
 # Check Messages
-messages = db.query(Message).all()
-print(f"\n[OK] Messages in database: {len(messages)}")
-for msg in messages[:5]:  # Show first 5
+message_count = db.query(func.count(Message.id)).scalar()
+print(f"\n[OK] Messages in database: {message_count}")
+for msg in db.query(Message).order_by(Message.id.desc()).limit(5):  # Show latest 5
     content_preview = msg.content[:30] if msg.content else "No content"
     print(f"   - Message ID: {msg.id}, Sender: {msg.sender_id}, Content: {content_preview}...")
 
 # Check Rooms
-rooms = db.query(Room).all()
-print(f"\n[OK] Rooms in database: {len(rooms)}")
-for room in rooms:
+room_count = db.query(func.count(Room.id)).scalar()
+print(f"\n[OK] Rooms in database: {room_count}")
+for room in db.query(Room).order_by(Room.id.desc()).limit(5):
     print(f"   - {room.name} (ID: {room.id})")
 
 print("\n" + "=" * 50)
@@ -38,4 +43,3 @@ print("[OK] Database is working correctly!")
 print("=" * 50)
 
 db.close()
-
@@ -19,7 +19,11 @@ def migrate_database():
     
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
-    
+
+    # WAL journaling makes the table rewrites some ALTERs trigger append-only
+    # instead of copying through the rollback journal
+    cursor.execute("PRAGMA journal_mode=WAL")
+
     try:
         # Check if columns exist
         cursor.execute("PRAGMA table_info(messages)")
@@ -38,16 +42,87 @@ def migrate_database():
         
         if 'updated_at' not in columns:
             migrations.append("ALTER TABLE messages ADD COLUMN updated_at DATETIME")
+
+        if 'file_id' not in columns:
+            migrations.append("ALTER TABLE messages ADD COLUMN file_id VARCHAR(64)")
         
         if migrations:
             print(f"Applying {len(migrations)} migration(s)...")
             for migration in migrations:
                 print(f"  - {migration}")
-                cursor.execute(migration)
-            conn.commit()
+            # One script, one transaction, one fsync - instead of a write
+            # transaction per ALTER
+            cursor.executescript("BEGIN;\n" + ";\n".join(migrations) + ";\nCOMMIT;\n")
             print("Migration completed successfully!")
         else:
             print("Database is already up to date. No migrations needed.")
+
+        # Convert legacy VARCHAR message statuses to their SMALLINT codes and
+        # add the composite index the status queries use
+        try:
+            cursor.execute(
+                "UPDATE messages SET status = CASE status "
+                "WHEN 'SENT' THEN 0 WHEN 'sent' THEN 0 "
+                "WHEN 'DELIVERED' THEN 1 WHEN 'delivered' THEN 1 "
+                "WHEN 'READ' THEN 2 WHEN 'read' THEN 2 "
+                "ELSE status END "
+                "WHERE typeof(status) = 'text'"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS ix_messages_conv_sender_status "
+                "ON messages(conversation_id, sender_id, status)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS ix_messages_room_created "
+                "ON messages(room_id, created_at)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS ix_messages_room_sender_status "
+                "ON messages(room_id, sender_id, status)"
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"Could not migrate message status storage: {e}")
+
+        # Backfill file_id from the stored path (the saved filename stem is
+        # the download id) and index it for the equality lookup
+        try:
+            cursor.execute(
+                "SELECT id, file_path FROM messages "
+                "WHERE file_path IS NOT NULL AND file_id IS NULL"
+            )
+            backfill = [
+                (os.path.splitext(os.path.basename(file_path))[0], row_id)
+                for row_id, file_path in cursor.fetchall()
+            ]
+            if backfill:
+                cursor.executemany(
+                    "UPDATE messages SET file_id = ? WHERE id = ?", backfill
+                )
+            # file_id is a content digest shared by duplicate uploads, so the
+            # index must not be unique; drop the earlier unique variant
+            cursor.execute("PRAGMA index_list(messages)")
+            for _, index_name, is_unique, *_ in cursor.fetchall():
+                if index_name == "ix_messages_file_id" and is_unique:
+                    cursor.execute("DROP INDEX ix_messages_file_id")
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS ix_messages_file_id "
+                "ON messages(file_id)"
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"Could not backfill message file ids: {e}")
+
+        # Unique index backing race-free conversation creation (skipped if
+        # legacy duplicate pairs exist)
+        try:
+            cursor.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_conversation_pair "
+                "ON conversations(user1_id, user2_id)"
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"Could not create uq_conversation_pair index: {e}")
     
     except Exception as e:
         print(f"Error during migration: {e}")